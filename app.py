@@ -1,13 +1,19 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 import matplotlib
 matplotlib.use('Agg')  # Must be before importing pyplot
 import matplotlib.pyplot as plt
 import io
 import base64
+import threading
+from functools import wraps
+from time import monotonic, sleep
 import math
-from database import db, User, SleepLog, LifestyleLog, SleepRecommendation
+from database import db, User, SleepLog, LifestyleLog, SleepRecommendation, SleepForecast, REPLICA_BIND, read_replica
+import forecast
+from shared_state import SharedStore, SharedWindowLimiter, SlidingWindowLimiter
 import json
 from datetime import datetime, time, timedelta, date, timezone
 import os
@@ -77,6 +83,63 @@ else:
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Optional read replica: analytics routes and batch jobs read from it
+replica_url = os.environ.get('DATABASE_REPLICA_URL')
+if replica_url:
+    if replica_url.startswith('postgres://'):
+        replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+    app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: replica_url}
+    logger.info("✅ Using read replica for analytics queries")
+
+# Read-your-writes: after a user writes, serve them from the primary for this many seconds
+app.config['REPLICA_PIN_SECONDS'] = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# Password hashing: any werkzeug method string, e.g. 'pbkdf2:sha256:600000' or 'scrypt:32768:8:1'
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+
+# Login throttling: max attempts per username+IP pair / per IP inside a sliding window (seconds)
+app.config['LOGIN_RATE_LIMIT'] = int(os.environ.get('LOGIN_RATE_LIMIT', 5))
+app.config['LOGIN_RATE_LIMIT_IP'] = int(os.environ.get('LOGIN_RATE_LIMIT_IP', 20))
+app.config['LOGIN_RATE_WINDOW'] = int(os.environ.get('LOGIN_RATE_WINDOW', 60))
+
+# User lookup caching (seconds): per-worker cache and signed-session snapshot lifetimes
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+app.config['USER_SNAPSHOT_TTL'] = int(os.environ.get('USER_SNAPSHOT_TTL', 300))
+
+# Max nights accepted by one /api/sleep_logs request
+app.config['SLEEP_LOG_BATCH_LIMIT'] = int(os.environ.get('SLEEP_LOG_BATCH_LIMIT', 366))
+
+# Recommendation retention: TTLs in days, sweep interval in seconds (0 disables the background sweeper)
+app.config['RECOMMENDATION_COMPLETED_TTL_DAYS'] = int(os.environ.get('RECOMMENDATION_COMPLETED_TTL_DAYS', 30))
+app.config['RECOMMENDATION_STALE_TTL_DAYS'] = int(os.environ.get('RECOMMENDATION_STALE_TTL_DAYS', 90))
+app.config['RECOMMENDATION_SWEEP_INTERVAL'] = int(os.environ.get('RECOMMENDATION_SWEEP_INTERVAL', 3600))
+app.config['RECOMMENDATION_SWEEP_BATCH'] = int(os.environ.get('RECOMMENDATION_SWEEP_BATCH', 500))
+
+# Sleep forecast smoothing: weight of the newest night, and daily carry-over of sleep debt
+app.config['FORECAST_ALPHA'] = float(os.environ.get('FORECAST_ALPHA', forecast.DEFAULT_ALPHA))
+app.config['FORECAST_DEBT_DECAY'] = float(os.environ.get('FORECAST_DEBT_DECAY', forecast.DEFAULT_DEBT_DECAY))
+
+# Stateless workers: keep cross-request state (secret key, user cache, login throttling,
+# sweeper lease) in a store shared by all workers/nodes instead of process memory.
+# Any SQLAlchemy URL works; a SQLite file is enough for several workers on one host.
+shared_store = None
+if os.environ.get('SHARED_STATE_URL'):
+    shared_store = SharedStore(os.environ['SHARED_STATE_URL'])
+    if not os.environ.get('SECRET_KEY'):
+        # Every worker must sign sessions with the same key
+        app.config['SECRET_KEY'] = shared_store.get_or_add('secret_key', os.urandom(24).hex())
+    logger.info("✅ Stateless mode: using shared state store")
+
+# Routing hint for user-sharded load balancing (0 disables)
+app.config['SHARD_COUNT'] = int(os.environ.get('SHARD_COUNT', 0))
+
+# Reverse proxies in front of the app (Render's router, a load balancer...) that append to
+# X-Forwarded-For. Set to the number of hops so request.remote_addr is the client, not the
+# last proxy; 0 trusts no forwarded headers (direct exposure / local development)
+app.config['PROXY_FIX_X_FOR'] = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+if app.config['PROXY_FIX_X_FOR']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
 # Initialize extensions AFTER app is configured
 db.init_app(app)
 login_manager = LoginManager()
@@ -109,20 +172,115 @@ def init_database():
                 logger.error("This might be because you're using SQLite locally. If deploying to Render, make sure DATABASE_URL is set.")
 
 # Call it before the first request - SINGLE before_request handler
+app.database_initialized = False
+_init_lock = threading.Lock()
+
 @app.before_request
 def before_first_request():
-    if not hasattr(app, 'database_initialized'):
-        init_database()
-        app.database_initialized = True
+    if not app.database_initialized:
+        with _init_lock:
+            if not app.database_initialized:
+                init_database()
+                start_recommendation_sweeper()
+                app.database_initialized = True
+
+# Lightweight user object built from cached fields, so page views don't need a User query
+class UserSnapshot(UserMixin):
+    def __init__(self, data):
+        self.id = data['id']
+        self.username = data['username']
+        self.sleep_goal = data['sleep_goal']
+
+def snapshot_user(user):
+    return {'id': user.id, 'username': user.username, 'sleep_goal': user.sleep_goal}
+
+# Short-TTL user cache: user_id -> (expires_at, snapshot dict), or the shared store when configured
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+def cache_user(data):
+    if shared_store:
+        shared_store.set(f"user:{data['id']}", data, ttl=app.config['USER_CACHE_TTL'])
+        return
+    with _user_cache_lock:
+        _user_cache[data['id']] = (monotonic() + app.config['USER_CACHE_TTL'], data)
+
+def get_cached_user(user_id):
+    if shared_store:
+        return shared_store.get(f"user:{user_id}")
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+    if cached and cached[0] > monotonic():
+        return cached[1]
+    return None
+
+def invalidate_user_cache(user_id):
+    if shared_store:
+        shared_store.delete(f"user:{user_id}")
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+    session.pop('user_snapshot', None)
+
+def remember_user(user):
+    # Store the snapshot in the worker cache and the signed session cookie
+    data = snapshot_user(user)
+    cache_user(data)
+    session['user_snapshot'] = dict(data, ts=datetime.now(timezone.utc).timestamp())
+    return data
 
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        return db.session.get(User, int(user_id))
+        user_id = int(user_id)
+
+        # 1. Signed session snapshot, valid for USER_SNAPSHOT_TTL seconds
+        snapshot = session.get('user_snapshot')
+        if snapshot and snapshot.get('id') == user_id:
+            age = datetime.now(timezone.utc).timestamp() - snapshot.get('ts', 0)
+            if age < app.config['USER_SNAPSHOT_TTL']:
+                return UserSnapshot(snapshot)
+
+        # 2. Worker (or shared) cache
+        cached = get_cached_user(user_id)
+        if cached:
+            session['user_snapshot'] = dict(cached, ts=datetime.now(timezone.utc).timestamp())
+            return UserSnapshot(cached)
+
+        # 3. Database
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        return UserSnapshot(remember_user(user))
     except Exception as e:
         logger.error(f"Error loading user: {e}")
         return None
 
+def replica_reads(view):
+    """Run a read-only view against the replica unless the user wrote recently."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if session.get('primary_until', 0) > datetime.now(timezone.utc).timestamp():
+            return view(*args, **kwargs)
+        with read_replica():
+            return view(*args, **kwargs)
+    return wrapped
+
+@app.after_request
+def pin_to_primary_after_write(response):
+    if db.session.info.get('wrote') and current_user.is_authenticated:
+        session['primary_until'] = datetime.now(timezone.utc).timestamp() + app.config['REPLICA_PIN_SECONDS']
+    return response
+
+@app.after_request
+def add_shard_hint(response):
+    # Lets a load balancer route each user to the same node (cookie or header hashing)
+    if app.config['SHARD_COUNT'] and current_user.is_authenticated:
+        shard = str(current_user.id % app.config['SHARD_COUNT'])
+        response.headers['X-User-Shard'] = shard
+        if request.cookies.get('shard') != shard:
+            response.set_cookie('shard', shard, samesite='Lax')
+    return response
+
 # Custom Jinja2 filters
 @app.template_filter('clamp')
 def clamp_filter(value, min_val, max_val):
@@ -157,6 +315,22 @@ def calculate_time_in_bed(bedtime, wake_up):
     
     return (wakeup_dt - bedtime_dt).total_seconds() / 3600
 
+# Password hashing helpers
+def hash_password(password):
+    return generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+
+_hash_prefix = None
+
+def password_needs_rehash(stored_hash):
+    # Werkzeug stores "<method>$<salt>$<hash>"; the method part carries the full
+    # parameters (iterations / scrypt cost), so compare it with what we'd produce now
+    global _hash_prefix
+    if _hash_prefix is None:
+        _hash_prefix = hash_password('').split('$', 1)[0]
+    return stored_hash.split('$', 1)[0] != _hash_prefix
+
+login_limiter = SharedWindowLimiter(shared_store) if shared_store else SlidingWindowLimiter()
+
 # Health check endpoint for Render
 @app.route('/health')
 def health():
@@ -179,11 +353,21 @@ def health():
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
+    # current_user is a cached snapshot; the profile page needs the full row
+    user = db.session.get(User, current_user.id)
+
     if request.method == 'POST':
-        current_user.age = request.form.get('age', type=int)
-        current_user.lifestyle = request.form.get('lifestyle')
-        current_user.sleep_goal = request.form.get('sleep_goal', type=int)
+        previous_goal = user.sleep_goal
+        user.age = request.form.get('age', type=int)
+        user.lifestyle = request.form.get('lifestyle')
+        user.sleep_goal = request.form.get('sleep_goal', type=int)
         db.session.commit()
+        invalidate_user_cache(user.id)
+        remember_user(user)
+        if user.sleep_goal != previous_goal:
+            # Sleep debt is measured against the goal, so recompute it
+            rebuild_sleep_forecast(user.id, user.sleep_goal)
+            db.session.commit()
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
     
@@ -208,64 +392,110 @@ def profile():
             consistency_score = max(0, 100 - (sum(variances) / len(variances) / max_variance * 100))
     
     return render_template('profile.html',
+                         user=user,
                          total_sleep_logs=total_sleep_logs,
                          avg_sleep_duration=avg_sleep_duration,
                          consistency_score=consistency_score)
 
 # Module 2: Sleep Logging Module
+def _optional_int(data, key, default, min_val, max_val):
+    value = data.get(key)
+    if value is None or value == '':
+        return default
+    # JSON clients: int() would quietly turn true into 1 and 5.7 into 5
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{key} must be a whole number")
+    value = int(value)
+    # Same limits the sleep log form enforces, so API clients can't store out-of-range values
+    if not min_val <= value <= max_val:
+        raise ValueError(f"{key} must be between {min_val} and {max_val}")
+    return value
+
+def build_sleep_log_row(user_id, data):
+    """Turn one night of form/JSON input into a sleep_log row with derived fields."""
+    date_val = datetime.strptime(data['date'], '%Y-%m-%d').date()
+    bedtime = datetime.strptime(data['bedtime'], '%H:%M').time()
+    wake_up = datetime.strptime(data['wake_up_time'], '%H:%M').time()
+
+    notes = data.get('notes')
+    if notes is None:
+        notes = ''
+    elif not isinstance(notes, str):
+        raise TypeError('notes must be a string')
+
+    sleep_latency = _optional_int(data, 'sleep_latency', 15, 0, 120)  # minutes
+    wake_after_sleep_onset = _optional_int(data, 'wake_after_sleep_onset', 0, 0, 240)  # minutes
+
+    # Calculate total time in bed
+    bedtime_dt = datetime.combine(date_val, bedtime)
+    wakeup_dt = datetime.combine(date_val, wake_up)
+
+    if wakeup_dt < bedtime_dt:
+        wakeup_dt += timedelta(days=1)
+
+    time_in_bed_hours = (wakeup_dt - bedtime_dt).total_seconds() / 3600
+
+    # Calculate actual sleep time (convert minutes to hours)
+    sleep_latency_hours = sleep_latency / 60
+    waso_hours = wake_after_sleep_onset / 60
+    actual_sleep_hours = max(0, time_in_bed_hours - sleep_latency_hours - waso_hours)
+
+    # Calculate sleep efficiency
+    sleep_efficiency = (actual_sleep_hours / time_in_bed_hours * 100) if time_in_bed_hours > 0 else 0
+    sleep_efficiency = max(0, min(100, sleep_efficiency))  # Clamp between 0-100
+
+    return {
+        'user_id': user_id,
+        'date': date_val,
+        'bedtime': bedtime,
+        'wake_up_time': wake_up,
+        'nap_duration': _optional_int(data, 'nap_duration', 0, 0, 240),
+        'sleep_latency': sleep_latency,  # Store in minutes
+        'wake_after_sleep_onset': wake_after_sleep_onset,  # Store in minutes
+        'sleep_quality': _optional_int(data, 'sleep_quality', 5, 1, 10),  # form slider default
+        'notes': notes,
+        'sleep_duration': actual_sleep_hours,  # Store actual sleep time in hours
+        'sleep_efficiency': sleep_efficiency,
+    }
+
+def upsert_sleep_logs(rows):
+    """Insert or update sleep logs keyed on (user_id, date). Caller commits."""
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        # No native upsert available: update existing rows one by one
+        for row in rows:
+            existing = SleepLog.query.filter_by(user_id=row['user_id'], date=row['date']).first()
+            if existing:
+                for key, value in row.items():
+                    setattr(existing, key, value)
+            else:
+                db.session.add(SleepLog(**row))
+        return
+
+    # Keep only the last entry per date so one statement never hits the same key twice
+    rows = list({(row['user_id'], row['date']): row for row in rows}.values())
+    stmt = dialect_insert(SleepLog.__table__)
+    updated = {key: stmt.excluded[key] for key in rows[0] if key not in ('user_id', 'date')}
+    stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'date'], set_=updated)
+    db.session.execute(stmt, rows)
+
 @app.route('/sleep_log', methods=['GET', 'POST'])
 @login_required
 def sleep_log():
     if request.method == 'POST':
         try:
-            date_str = request.form['date']
-            bedtime_str = request.form['bedtime']
-            wakeup_str = request.form['wake_up_time']
-            
-            date_val = datetime.strptime(date_str, '%Y-%m-%d').date()
-            bedtime = datetime.strptime(bedtime_str, '%H:%M').time()
-            wake_up = datetime.strptime(wakeup_str, '%H:%M').time()
-            
-            # Get the new fields
-            sleep_latency = request.form.get('sleep_latency', 15, type=int)  # minutes
-            wake_after_sleep_onset = request.form.get('wake_after_sleep_onset', 0, type=int)  # minutes
-            
-            # Calculate total time in bed
-            bedtime_dt = datetime.combine(date_val, bedtime)
-            wakeup_dt = datetime.combine(date_val, wake_up)
-            
-            if wakeup_dt < bedtime_dt:
-                wakeup_dt += timedelta(days=1)
-            
-            time_in_bed_hours = (wakeup_dt - bedtime_dt).total_seconds() / 3600
-            
-            # Calculate actual sleep time (convert minutes to hours)
-            sleep_latency_hours = sleep_latency / 60
-            waso_hours = wake_after_sleep_onset / 60
-            actual_sleep_hours = max(0, time_in_bed_hours - sleep_latency_hours - waso_hours)
-            
-            # Calculate sleep efficiency
-            sleep_efficiency = (actual_sleep_hours / time_in_bed_hours * 100) if time_in_bed_hours > 0 else 0
-            sleep_efficiency = max(0, min(100, sleep_efficiency))  # Clamp between 0-100
-            
-            # Create sleep log with corrected values
-            sleep_log_entry = SleepLog(
-                user_id=current_user.id,
-                date=date_val,
-                bedtime=bedtime,
-                wake_up_time=wake_up,
-                nap_duration=request.form.get('nap_duration', 0, type=int),
-                sleep_latency=sleep_latency,  # Store in minutes
-                wake_after_sleep_onset=wake_after_sleep_onset,  # Store in minutes
-                sleep_quality=request.form.get('sleep_quality', type=int),
-                notes=request.form.get('notes', ''),
-                sleep_duration=actual_sleep_hours,  # Store actual sleep time in hours
-                sleep_efficiency=sleep_efficiency
-            )
-            
-            db.session.add(sleep_log_entry)
+            # Re-submitting a date updates that night instead of adding a duplicate
+            row = build_sleep_log_row(current_user.id, request.form)
+            upsert_sleep_logs([row])
             db.session.commit()
-            
+            refresh_sleep_forecast(current_user.id, [row])
+
             # Generate recommendations
             generate_sleep_recommendations(current_user.id)
             
@@ -286,6 +516,7 @@ def sleep_log():
 
 @app.route('/analysis')
 @login_required
+@replica_reads
 def analysis():
     # Get sleep logs from last 7 days
     end_date = datetime.now(timezone.utc).date()
@@ -373,7 +604,168 @@ def lifestyle():
     
     return render_template('lifestyle.html', recent_logs=recent_logs)
 
+# Predictive sleep forecast (incremental, see forecast.py)
+FORECAST_FIELDS = (SleepLog.date, SleepLog.bedtime, SleepLog.wake_up_time,
+                   SleepLog.sleep_duration, SleepLog.sleep_efficiency)
+
+def rebuild_sleep_forecast(user_id, sleep_goal, state=None):
+    """Recompute forecast state from the full history; only needed after edits or goal changes."""
+    if state is None:
+        state = db.session.get(SleepForecast, user_id) or SleepForecast(user_id=user_id)
+        db.session.add(state)
+    forecast.reset_state(state)
+    nights = db.session.query(*FORECAST_FIELDS).filter(
+        SleepLog.user_id == user_id
+    ).order_by(SleepLog.date).yield_per(500)
+    for night in nights:
+        forecast.apply_night(state, night._mapping, sleep_goal,
+                             app.config['FORECAST_ALPHA'], app.config['FORECAST_DEBT_DECAY'])
+    return state
+
+def current_sleep_goal(user_id):
+    # Write paths read the goal from the users table: the session snapshot can still
+    # hold the old goal after it was changed from another session
+    return db.session.query(User.sleep_goal).filter_by(id=user_id).scalar()
+
+def update_sleep_forecast(user_id, rows):
+    """Fold newly saved sleep_log rows into the user's forecast in O(1) per night."""
+    sleep_goal = current_sleep_goal(user_id)
+    # Like upsert_sleep_logs, only the last entry per date is stored, so only fold that one in
+    rows = sorted({row['date']: row for row in rows}.values(), key=lambda row: row['date'])
+    state = db.session.get(SleepForecast, user_id)
+    if state is None or (state.last_date and rows[0]['date'] <= state.last_date):
+        # First forecast for this user, or an older night was added/edited
+        rebuild_sleep_forecast(user_id, sleep_goal, state)
+    else:
+        for row in rows:
+            forecast.apply_night(state, row, sleep_goal,
+                                 app.config['FORECAST_ALPHA'], app.config['FORECAST_DEBT_DECAY'])
+    db.session.commit()
+
+def refresh_sleep_forecast(user_id, rows):
+    """Update the forecast after nights were committed; failures are logged, not raised.
+
+    The nights are already saved at this point, so reporting an error would make
+    clients retry a write that succeeded. Instead the forecast state is dropped,
+    and get_sleep_forecast() rebuilds it from history on the next read.
+    """
+    try:
+        update_sleep_forecast(user_id, rows)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Sleep forecast update failed for user {user_id}: {e}")
+        try:
+            SleepForecast.query.filter_by(user_id=user_id).delete()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Could not reset sleep forecast for user {user_id}: {e}")
+
+def get_sleep_forecast(user_id, sleep_goal):
+    state = db.session.get(SleepForecast, user_id)
+    if state is None and SleepLog.query.filter_by(user_id=user_id).first():
+        # Users with history from before forecasts existed
+        sleep_goal = current_sleep_goal(user_id)
+        state = rebuild_sleep_forecast(user_id, sleep_goal)
+        db.session.commit()
+    return forecast.predict(state, sleep_goal)
+
 # Module 5: Sleep Recommendation Module (Rule-based)
+def save_recommendations(user_id, recommendations):
+    """Store recommendations, refreshing an open one of the same type instead of adding a duplicate."""
+    today = datetime.now(timezone.utc).date()
+    types = [rec['type'] for rec in recommendations]
+    open_recs = {}
+    if types:
+        open_recs = {rec.recommendation_type: rec for rec in SleepRecommendation.query.filter(
+            SleepRecommendation.user_id == user_id,
+            SleepRecommendation.is_completed == False,
+            SleepRecommendation.recommendation_type.in_(types)
+        )}
+
+    for rec in recommendations:
+        recommendation = open_recs.get(rec['type'])
+        if recommendation is None:
+            recommendation = SleepRecommendation(user_id=user_id, recommendation_type=rec['type'])
+            db.session.add(recommendation)
+        recommendation.date = today
+        recommendation.message = rec['message']
+        recommendation.priority = rec['priority']
+
+    db.session.commit()
+
+def sweep_recommendations(batch_size=None, pause=0.05):
+    """Delete recommendations past their TTL in small batches; returns the number of rows removed."""
+    batch_size = batch_size or app.config['RECOMMENDATION_SWEEP_BATCH']
+    now = datetime.now(timezone.utc)
+    completed_cutoff = (now - timedelta(days=app.config['RECOMMENDATION_COMPLETED_TTL_DAYS'])).replace(tzinfo=None)
+    stale_cutoff = (now - timedelta(days=app.config['RECOMMENDATION_STALE_TTL_DAYS'])).date()
+
+    expired = db.or_(
+        db.and_(SleepRecommendation.is_completed == True,
+                db.func.coalesce(SleepRecommendation.completed_at, SleepRecommendation.created_at) < completed_cutoff),
+        db.and_(SleepRecommendation.is_completed == False,
+                SleepRecommendation.date < stale_cutoff),
+    )
+
+    started = monotonic()
+    with read_replica():
+        rows_before = SleepRecommendation.query.count()
+    deleted = 0
+    last_id = 0
+    while True:
+        # Find candidates on the replica; the deletes themselves always go to the primary.
+        # Page by id: a lagging replica keeps returning rows we already deleted, so
+        # re-running the same LIMIT query would never get past them
+        with read_replica():
+            ids = [row.id for row in db.session.query(SleepRecommendation.id).filter(
+                expired, SleepRecommendation.id > last_id
+            ).order_by(SleepRecommendation.id).limit(batch_size)]
+        if not ids:
+            break
+        last_id = ids[-1]
+        # Short transactions per batch keep row locks brief for concurrent writers
+        # Re-check expiry on the primary: a row refreshed or completed since the replica
+        # last caught up may still look expired there
+        removed = SleepRecommendation.query.filter(
+            SleepRecommendation.id.in_(ids), expired
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += removed
+        if len(ids) < batch_size:
+            break
+        sleep(pause)
+
+    logger.info(f"Recommendation sweep: removed {deleted} of {rows_before} rows "
+                f"in {monotonic() - started:.2f}s, {rows_before - deleted} remaining")
+    return deleted
+
+def start_recommendation_sweeper():
+    interval = app.config['RECOMMENDATION_SWEEP_INTERVAL']
+    if interval <= 0:
+        return
+
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    # With shared state, only the worker holding the lease sweeps this interval
+                    if shared_store is None or shared_store.add('lease:recommendation-sweep', os.getpid(), ttl=interval * 0.9):
+                        sweep_recommendations()
+                        if shared_store:
+                            shared_store.purge()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Recommendation sweep failed: {e}")
+            sleep(interval)
+
+    threading.Thread(target=run, name='recommendation-sweeper', daemon=True).start()
+
+@app.cli.command('sweep-recommendations')
+def sweep_recommendations_command():
+    """Run one recommendation retention sweep (for cron jobs)."""
+    print(f"Removed {sweep_recommendations()} expired recommendations")
+
 def generate_sleep_recommendations(user_id):
     # Get last 3 sleep logs
     sleep_logs = SleepLog.query.filter_by(
@@ -424,17 +816,7 @@ def generate_sleep_recommendations(user_id):
         })
     
     # Save recommendations to database
-    for rec in recommendations:
-        recommendation = SleepRecommendation(
-            user_id=user_id,
-            date=datetime.now(timezone.utc).date(),
-            recommendation_type=rec['type'],
-            message=rec['message'],
-            priority=rec['priority']
-        )
-        db.session.add(recommendation)
-    
-    db.session.commit()
+    save_recommendations(user_id, recommendations)
 
 def generate_lifestyle_recommendations(user_id, lifestyle_log):
     recommendations = []
@@ -474,20 +856,11 @@ def generate_lifestyle_recommendations(user_id, lifestyle_log):
             })
     
     # Save recommendations
-    for rec in recommendations:
-        recommendation = SleepRecommendation(
-            user_id=user_id,
-            date=datetime.now(timezone.utc).date(),
-            recommendation_type=rec['type'],
-            message=rec['message'],
-            priority=rec['priority']
-        )
-        db.session.add(recommendation)
-    
-    db.session.commit()
+    save_recommendations(user_id, recommendations)
 
 @app.route('/reports')
 @login_required
+@replica_reads
 def reports():
     # Get sleep data for the last 30 days
     end_date = datetime.now(timezone.utc).date()
@@ -574,6 +947,7 @@ def dashboard():
     
     return render_template('dashboard.html',
                          today_sleep=today_sleep,
+                         forecast=get_sleep_forecast(current_user.id, current_user.sleep_goal),
                          avg_duration=avg_duration,
                          avg_quality=avg_quality,
                          recommendations=recommendations,
@@ -595,7 +969,7 @@ def register():
             flash('Email already registered', 'error')
             return redirect(url_for('register'))
         
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+        hashed_password = hash_password(password)
         
         user = User(
             username=username,
@@ -619,13 +993,31 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        
+
+        # Throttle before touching the database or doing any hashing work
+        window = app.config['LOGIN_RATE_WINDOW']
+        # Per-user bucket is scoped to the client IP, so failures from one source
+        # can't lock the real user out of their account
+        user_key = f"user:{username.lower()}@{request.remote_addr}"
+        ip_key = f"ip:{request.remote_addr}"
+        if not (login_limiter.hit(ip_key, app.config['LOGIN_RATE_LIMIT_IP'], window) and
+                login_limiter.hit(user_key, app.config['LOGIN_RATE_LIMIT'], window)):
+            logger.warning(f"Login rate limit exceeded for {username} from {request.remote_addr}")
+            flash('Too many login attempts. Please wait a minute and try again.', 'error')
+            return render_template('login.html'), 429
+
         user = User.query.filter_by(username=username).first()
-        
+
         if user and check_password_hash(user.password, password):
+            # Upgrade the stored hash if the configured parameters changed
+            if password_needs_rehash(user.password):
+                user.password = hash_password(password)
+                db.session.commit()
+            login_limiter.reset(user_key)
             login_user(user)
+            remember_user(user)
             return redirect(url_for('dashboard'))
-        
+
         flash('Invalid username or password', 'error')
     
     return render_template('login.html')
@@ -634,6 +1026,7 @@ def login():
 @login_required
 def logout():
     logout_user()
+    session.pop('user_snapshot', None)
     return redirect(url_for('index'))
 
 @app.route('/')
@@ -648,6 +1041,7 @@ def complete_recommendation(rec_id):
     recommendation = SleepRecommendation.query.get_or_404(rec_id)
     if recommendation.user_id == current_user.id:
         recommendation.is_completed = True
+        recommendation.completed_at = datetime.now(timezone.utc)
         db.session.commit()
         flash('Recommendation marked as completed!', 'success')
     return redirect(request.referrer or url_for('dashboard'))
@@ -655,6 +1049,7 @@ def complete_recommendation(rec_id):
 # API endpoints for data
 @app.route('/api/sleep_data')
 @login_required
+@replica_reads
 def api_sleep_data():
     # Get sleep data for charts
     sleep_logs = SleepLog.query.filter_by(
@@ -669,6 +1064,52 @@ def api_sleep_data():
     
     return jsonify(data)
 
+@app.route('/api/forecast')
+@login_required
+def api_forecast():
+    prediction = get_sleep_forecast(current_user.id, current_user.sleep_goal)
+    if prediction is None:
+        return jsonify({'nights': 0, 'message': 'Log some sleep to get a forecast'})
+    return jsonify(prediction)
+
+# Batch sync endpoint: {"nights": [{"date": "2024-01-31", "bedtime": "23:00", "wake_up_time": "07:00", ...}]}
+@app.route('/api/sleep_logs', methods=['POST'])
+@login_required
+def api_sleep_logs_batch():
+    payload = request.get_json(silent=True)
+    nights = payload.get('nights') if isinstance(payload, dict) else payload
+    if not isinstance(nights, list) or not nights:
+        return jsonify({'error': 'Expected a non-empty list of nights'}), 400
+    if len(nights) > app.config['SLEEP_LOG_BATCH_LIMIT']:
+        return jsonify({'error': f"At most {app.config['SLEEP_LOG_BATCH_LIMIT']} nights per request"}), 413
+
+    rows = []
+    errors = []
+    for index, night in enumerate(nights):
+        try:
+            if not isinstance(night, dict):
+                raise ValueError('night must be an object')
+            rows.append(build_sleep_log_row(current_user.id, night))
+        except (KeyError, ValueError, TypeError) as e:
+            errors.append({'index': index, 'error': f"{type(e).__name__}: {e}"})
+    if errors:
+        return jsonify({'error': 'Invalid nights', 'details': errors}), 400
+
+    # All nights are written in one transaction
+    try:
+        upsert_sleep_logs(rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Batch sleep log upsert failed: {e}")
+        return jsonify({'error': 'Could not save sleep logs'}), 500
+
+    refresh_sleep_forecast(current_user.id, rows)
+    generate_sleep_recommendations(current_user.id)
+
+    dates = sorted({row['date'] for row in rows})
+    return jsonify({'saved': len(dates), 'dates': [d.strftime('%Y-%m-%d') for d in dates]})
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
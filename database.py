@@ -1,9 +1,47 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from flask_login import UserMixin
 import json
 
-db = SQLAlchemy()
+REPLICA_BIND = 'replica'
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to the read replica while read_replica() is active.
+
+    Flushes and any other statement (INSERT/UPDATE/DELETE) always use the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('use_replica') and not self._flushing
+                and isinstance(clause, Select) and REPLICA_BIND in self._db.engines):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_flush(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _record_write_statement(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE via session.execute() bypass the flush
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+@contextmanager
+def read_replica():
+    """Route reads in this block to the replica (no-op if DATABASE_REPLICA_URL isn't set)."""
+    previous = db.session.info.get('use_replica', False)
+    db.session.info['use_replica'] = True
+    try:
+        yield
+    finally:
+        db.session.info['use_replica'] = previous
 
 def get_utc_now():
     return datetime.now(timezone.utc)
@@ -25,6 +63,9 @@ class User(db.Model, UserMixin):
     lifestyle_logs = db.relationship('LifestyleLog', backref='user', lazy=True)
 
 class SleepLog(db.Model):
+    # One log per user per night; writes upsert on this key
+    __table_args__ = (db.UniqueConstraint('user_id', 'date', name='uq_sleep_log_user_date'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=get_utc_today)
@@ -57,6 +98,13 @@ class LifestyleLog(db.Model):
     created_at = db.Column(db.DateTime, default=get_utc_now)
 
 class SleepRecommendation(db.Model):
+    # Partial index serving the dashboard/report "open recommendations by priority" queries
+    __table_args__ = (
+        db.Index('ix_sleep_recommendation_open', 'user_id', 'priority',
+                 postgresql_where=db.text('is_completed = false'),
+                 sqlite_where=db.text('is_completed = 0')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=get_utc_today)
@@ -64,4 +112,19 @@ class SleepRecommendation(db.Model):
     message = db.Column(db.Text)
     priority = db.Column(db.Integer, default=1)
     is_completed = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=get_utc_now)
\ No newline at end of file
+    completed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=get_utc_now)
+
+class SleepForecast(db.Model):
+    # Exponentially weighted per-user state maintained by forecast.apply_night()
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    nights = db.Column(db.Integer, default=0, nullable=False)
+    last_date = db.Column(db.Date)
+    sleep_debt = db.Column(db.Float, default=0)  # hours
+    duration_avg = db.Column(db.Float)  # hours
+    bedtime_avg = db.Column(db.Float)  # minutes after noon
+    bedtime_drift = db.Column(db.Float, default=0)  # minutes per night
+    wake_avg = db.Column(db.Float)  # minutes after midnight
+    efficiency_avg = db.Column(db.Float)  # percentage
+    efficiency_trend = db.Column(db.Float, default=0)  # percentage points per night
+    updated_at = db.Column(db.DateTime, default=get_utc_now, onupdate=get_utc_now)
\ No newline at end of file
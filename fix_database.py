@@ -1,6 +1,6 @@
 # fix_database.py
 from app import app
-from database import db
+from database import db, SleepRecommendation
 from sqlalchemy import inspect, text
 
 with app.app_context():
@@ -25,7 +25,31 @@ with app.app_context():
             print("Adding wake_after_sleep_onset column...")
             conn.execute(text("ALTER TABLE sleep_log ADD COLUMN wake_after_sleep_onset INTEGER DEFAULT 0"))
             print("✓ Added wake_after_sleep_onset")
-        
+
+        # Enforce one sleep log per user per night (needed for upserts)
+        indexes = [idx['name'] for idx in inspector.get_indexes('sleep_log')]
+        constraints = [uc['name'] for uc in inspector.get_unique_constraints('sleep_log')]
+        if 'uq_sleep_log_user_date' not in indexes + constraints:
+            print("Removing duplicate sleep logs (keeping the latest per user/date)...")
+            result = conn.execute(text(
+                "DELETE FROM sleep_log WHERE id NOT IN "
+                "(SELECT MAX(id) FROM sleep_log GROUP BY user_id, date)"
+            ))
+            print(f"✓ Removed {result.rowcount} duplicate rows")
+            conn.execute(text("CREATE UNIQUE INDEX uq_sleep_log_user_date ON sleep_log (user_id, date)"))
+            print("✓ Added unique index on (user_id, date)")
+
+        # Recommendation retention: completion timestamp and partial index on open rows
+        rec_columns = [col['name'] for col in inspector.get_columns('sleep_recommendation')]
+        if 'completed_at' not in rec_columns:
+            print("Adding completed_at column...")
+            conn.execute(text("ALTER TABLE sleep_recommendation ADD COLUMN completed_at TIMESTAMP"))
+            print("✓ Added completed_at")
+
+        for index in SleepRecommendation.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+        print("✓ Verified sleep_recommendation indexes")
+
         conn.commit()
     
     # Verify the fix
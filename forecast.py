@@ -0,0 +1,98 @@
+# forecast.py
+# Predictive sleep model: exponentially weighted per-user state that is updated
+# in O(1) for each new night, so predictions never rescan the sleep history.
+
+# Weight of the newest night in the moving averages
+DEFAULT_ALPHA = 0.3
+# Fraction of the previous sleep debt still owed the next day
+DEFAULT_DEBT_DECAY = 0.85
+# Extra sleep per night recommended to pay debt back (hours)
+MAX_DEBT_PAYBACK = 1.0
+
+
+def _minutes_after_noon(t):
+    # Bedtimes straddle midnight, so measure them from noon to keep averages continuous
+    return (t.hour * 60 + t.minute - 720) % 1440
+
+
+def _minutes_after_midnight(t):
+    return t.hour * 60 + t.minute
+
+
+def _clock(minutes):
+    minutes = int(round(minutes)) % 1440
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _ewma(previous, value, alpha):
+    return previous + alpha * (value - previous)
+
+
+def reset_state(state):
+    state.nights = 0
+    state.last_date = None
+    state.sleep_debt = 0.0
+    state.duration_avg = None
+    state.bedtime_avg = None
+    state.bedtime_drift = 0.0
+    state.wake_avg = None
+    state.efficiency_avg = None
+    state.efficiency_trend = 0.0
+
+
+def apply_night(state, night, sleep_goal, alpha=DEFAULT_ALPHA, debt_decay=DEFAULT_DEBT_DECAY):
+    """Fold one night (a mapping with sleep_log fields) into a SleepForecast row in place."""
+    duration = night['sleep_duration'] or 0
+    bedtime = _minutes_after_noon(night['bedtime'])
+    wake = _minutes_after_midnight(night['wake_up_time'])
+    efficiency = night['sleep_efficiency'] or 0
+    goal = sleep_goal or 8
+
+    if not state.nights:
+        state.duration_avg = duration
+        state.bedtime_avg = bedtime
+        state.bedtime_drift = 0.0
+        state.wake_avg = wake
+        state.efficiency_avg = efficiency
+        state.efficiency_trend = 0.0
+        state.sleep_debt = max(0.0, goal - duration)
+    else:
+        previous_bedtime = state.bedtime_avg
+        previous_efficiency = state.efficiency_avg
+        state.duration_avg = _ewma(state.duration_avg, duration, alpha)
+        state.bedtime_avg = _ewma(previous_bedtime, bedtime, alpha)
+        state.bedtime_drift = _ewma(state.bedtime_drift, state.bedtime_avg - previous_bedtime, alpha)
+        state.wake_avg = _ewma(state.wake_avg, wake, alpha)
+        state.efficiency_avg = _ewma(previous_efficiency, efficiency, alpha)
+        state.efficiency_trend = _ewma(state.efficiency_trend, state.efficiency_avg - previous_efficiency, alpha)
+        # Debt carries over per calendar day, so unlogged nights in between still pay some of it back
+        days = max(1, (night['date'] - state.last_date).days)
+        state.sleep_debt = max(0.0, state.sleep_debt * debt_decay ** days + (goal - duration))
+
+    state.nights += 1
+    state.last_date = night['date']
+
+
+def predict(state, sleep_goal):
+    """Build the forecast served by the API and dashboard from a SleepForecast row."""
+    if state is None or not state.nights:
+        return None
+
+    goal = sleep_goal or 8
+    efficiency = state.efficiency_avg or 85
+    # Time in bed needed to reach the goal plus part of the debt at the usual efficiency
+    needed_sleep = goal + min(state.sleep_debt, MAX_DEBT_PAYBACK)
+    time_in_bed_minutes = needed_sleep / (efficiency / 100) * 60
+
+    return {
+        'nights': state.nights,
+        'last_date': state.last_date.strftime('%Y-%m-%d'),
+        'sleep_debt': round(state.sleep_debt, 2),
+        'predicted_duration': round(state.duration_avg, 2),
+        'predicted_bedtime': _clock(state.bedtime_avg + state.bedtime_drift + 720),
+        'bedtime_drift_minutes': round(state.bedtime_drift, 1),
+        'recommended_bedtime': _clock(state.wake_avg - time_in_bed_minutes),
+        'predicted_wake_time': _clock(state.wake_avg),
+        'efficiency': round(state.efficiency_avg, 1),
+        'efficiency_trend': round(state.efficiency_trend, 2),
+    }
@@ -0,0 +1,117 @@
+# load_test.py
+# Multi-worker load test for the stateless deployment mode.
+#
+# Starts gunicorn with 1, 2, 4... workers against throwaway SQLite databases
+# (app data + SHARED_STATE_URL), logs in a set of users, then hammers the
+# authenticated read path from several client processes and reports the
+# throughput for each worker count.
+#
+#   python load_test.py --workers 1 2 4 --clients 8 --duration 10
+import argparse
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+PATHS = ['/api/forecast', '/api/sleep_data']
+
+
+def make_client(base_url, username):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    form = urllib.parse.urlencode({
+        'username': username, 'email': f'{username}@example.com', 'password': 'load-test', 'sleep_goal': 8
+    }).encode()
+    opener.open(f'{base_url}/register', form).read()
+    opener.open(f'{base_url}/login', form).read()
+
+    nights = [{'date': f'2024-01-{day:02d}', 'bedtime': '23:00', 'wake_up_time': '07:00'} for day in range(1, 29)]
+    request = urllib.request.Request(f'{base_url}/api/sleep_logs', json.dumps(nights).encode(),
+                                     {'Content-Type': 'application/json'})
+    opener.open(request).read()
+    return opener
+
+
+def run_client(args):
+    base_url, username, duration = args
+    opener = make_client(base_url, username)
+    done = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            with opener.open(base_url + PATHS[done % len(PATHS)]) as response:
+                response.read()
+                # A lost session shows up as a redirect to the HTML login page
+                if response.headers.get_content_type() != 'application/json':
+                    raise RuntimeError('not authenticated')
+            done += 1
+        except Exception:
+            errors += 1
+    return done, errors
+
+
+def wait_for(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'{base_url}/health').read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server at {base_url} did not come up')
+
+
+def measure(workers, clients, duration, port):
+    workdir = tempfile.mkdtemp(prefix='sleep-tracker-load-')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'app.db')}",
+               SHARED_STATE_URL=f"sqlite:///{os.path.join(workdir, 'shared.db')}",
+               RECOMMENDATION_SWEEP_INTERVAL='0',
+               LOGIN_RATE_LIMIT_IP='100000')
+    env['SECRET_KEY'] = ''  # blank (not unset, or .env supplies one): workers agree on a key via the shared store
+
+    base_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        ['gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'app:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for(base_url)
+        jobs = [(base_url, f'load{workers}_{i}', duration) for i in range(clients)]
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(run_client, jobs)
+    finally:
+        server.terminate()
+        server.wait()
+
+    done = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    return done / duration, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-worker throughput test')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    print(f'CPUs available: {os.cpu_count()}')
+    baseline = None
+    for workers in args.workers:
+        throughput, errors = measure(workers, args.clients, args.duration, args.port)
+        baseline = baseline or throughput / workers
+        print(f'{workers} worker(s): {throughput:8.1f} req/s  '
+              f'(scaling {throughput / baseline:.2f}x of 1 worker, {errors} errors)')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
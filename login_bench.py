@@ -0,0 +1,89 @@
+# login_bench.py
+# Password hashing and login throttling benchmark.
+#
+# Times hash_password for the configured PASSWORD_HASH_METHOD (or --method),
+# then replays a password-guessing attack against one account through /login
+# from several client IPs, once with the login limiter at its configured
+# limits and once with it effectively disabled, and reports the throughput and
+# CPU time the server spends per attempt in each case.
+#
+#   python login_bench.py --method scrypt:32768:8:1 --attempts 200 --ips 4
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+workdir = tempfile.mkdtemp(prefix='sleep-tracker-login-')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'app.db')}",
+    RECOMMENDATION_SWEEP_INTERVAL='0',
+)
+os.environ.pop('SHARED_STATE_URL', None)
+
+import app as sleep_app  # noqa: E402
+from shared_state import SlidingWindowLimiter  # noqa: E402
+
+app = sleep_app.app
+logging.getLogger('app').setLevel(logging.ERROR)  # one throttle warning per rejected attempt
+UNLIMITED = 10 ** 9
+
+
+def time_hashing(rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        sleep_app.hash_password(f'password-{i}')
+    return (time.perf_counter() - start) / rounds
+
+
+def run_attack(client, attempts, ips):
+    statuses = {}
+    wall, cpu = time.perf_counter(), time.process_time()
+    for i in range(attempts):
+        response = client.post('/login', data={'username': 'victim', 'password': f'guess-{i}'},
+                               environ_base={'REMOTE_ADDR': f'203.0.113.{i % ips + 1}'})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return attempts / wall, cpu / attempts, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Password hashing and login limiter benchmark')
+    parser.add_argument('--method', default=None, help='werkzeug hash method (default: PASSWORD_HASH_METHOD)')
+    parser.add_argument('--hashes', type=int, default=20)
+    parser.add_argument('--attempts', type=int, default=200)
+    parser.add_argument('--ips', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.method:
+        app.config['PASSWORD_HASH_METHOD'] = args.method
+    app.config['TESTING'] = True
+    client = app.test_client()
+
+    per_hash = time_hashing(args.hashes)
+    print(f"hash_password ({app.config['PASSWORD_HASH_METHOD']}): "
+          f"{per_hash * 1000:.1f} ms/hash, {1 / per_hash:.1f} hashes/s")
+
+    client.post('/register', data={'username': 'victim', 'email': 'victim@example.com',
+                                   'password': 'correct horse', 'sleep_goal': 8})
+
+    limits = (app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_LIMIT_IP'])
+    for label, (user_limit, ip_limit) in [('limiter on ', limits), ('limiter off', (UNLIMITED, UNLIMITED))]:
+        app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_LIMIT_IP'] = user_limit, ip_limit
+        sleep_app.login_limiter = SlidingWindowLimiter()
+        throughput, cpu, statuses = run_attack(client, args.attempts, args.ips)
+        print(f'{label}: {throughput:8.1f} attempts/s  {cpu * 1000:6.2f} ms CPU/attempt  '
+              f'({statuses.get(200, 0)} checked, {statuses.get(429, 0)} throttled)')
+
+    # The real user still gets in from their own address after the attack
+    app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_LIMIT_IP'] = limits
+    response = client.post('/login', data={'username': 'victim', 'password': 'correct horse'},
+                           environ_base={'REMOTE_ADDR': '198.51.100.1'})
+    ok = response.status_code == 302
+    print('OK' if ok else f'FAIL: victim login returned {response.status_code}')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# replica_check.py
+# Verifies read-replica routing with two local SQLite databases.
+#
+# The "replica" is a file copy of the primary taken after seeding, so it goes
+# stale as soon as the user writes again. Statements are counted per engine to
+# check that analytics routes read from the replica, that a user who just
+# wrote is pinned to the primary (read-your-writes), and how much load the
+# analytics workload moves off the primary.
+#
+#   python replica_check.py --reads 50
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+workdir = tempfile.mkdtemp(prefix='sleep-tracker-replica-')
+PRIMARY = os.path.join(workdir, 'primary.db')
+REPLICA = os.path.join(workdir, 'replica.db')
+os.environ.update(
+    DATABASE_URL=f'sqlite:///{PRIMARY}',
+    DATABASE_REPLICA_URL=f'sqlite:///{REPLICA}',
+    RECOMMENDATION_SWEEP_INTERVAL='0',
+)
+os.environ.pop('SHARED_STATE_URL', None)
+
+from sqlalchemy import event  # noqa: E402
+
+from app import app, db  # noqa: E402
+from database import REPLICA_BIND  # noqa: E402
+
+ANALYTICS = ['/reports', '/analysis', '/api/sleep_data']
+
+
+def count_statements(engine, counts, name):
+    event.listen(engine, 'before_cursor_execute', lambda *args: counts.__setitem__(name, counts[name] + 1))
+
+
+def expire_pin(client):
+    with client.session_transaction() as sess:
+        sess.pop('primary_until', None)
+
+
+def run_workload(client, reads):
+    for i in range(reads):
+        client.get(ANALYTICS[i % len(ANALYTICS)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read-replica routing check')
+    parser.add_argument('--reads', type=int, default=50)
+    args = parser.parse_args()
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+
+    # Seed the primary, then snapshot it as the replica
+    form = {'username': 'replica', 'email': 'replica@example.com', 'password': 'replica', 'sleep_goal': 8}
+    client.post('/register', data=form)
+    client.post('/login', data=form)
+    nights = [{'date': f'2024-01-{day:02d}', 'bedtime': '23:00', 'wake_up_time': '07:00'} for day in range(1, 29)]
+    client.post('/api/sleep_logs', json=nights)
+    with app.app_context():
+        db.engines[None].dispose()
+        db.engines[REPLICA_BIND].dispose()
+    shutil.copy(PRIMARY, REPLICA)
+
+    counts = {'primary': 0, 'replica': 0}
+    with app.app_context():
+        count_statements(db.engines[None], counts, 'primary')
+        count_statements(db.engines[REPLICA_BIND], counts, 'replica')
+
+    failures = []
+
+    # 1. Analytics reads go to the replica once no write pin is active
+    expire_pin(client)
+    run_workload(client, args.reads)
+    routed = dict(counts)
+    print(f"Analytics workload ({args.reads} requests): primary={routed['primary']} replica={routed['replica']} statements")
+    if routed['replica'] == 0:
+        failures.append('analytics reads never reached the replica')
+
+    # 2. Read-your-writes: right after a write the user must read from the primary
+    client.post('/api/sleep_logs', json=[{'date': '2024-02-01', 'bedtime': '23:00', 'wake_up_time': '07:00'}])
+    before = dict(counts)
+    client.get('/api/sleep_data')
+    client.get('/reports')
+    if counts['replica'] != before['replica']:
+        failures.append('reads right after a write were sent to the replica')
+    print(f"After write: primary +{counts['primary'] - before['primary']}, "
+          f"replica +{counts['replica'] - before['replica']} statements (pinned to primary)")
+
+    # 3. Once the pin expires the stale replica is used again
+    expire_pin(client)
+    before = dict(counts)
+    client.get('/api/sleep_data')
+    if counts['replica'] == before['replica']:
+        failures.append('reads did not return to the replica after the pin expired')
+
+    # Primary load with the replica disabled, for comparison
+    app.config['SQLALCHEMY_BINDS'] = {}
+    with app.app_context():
+        replica_engine = db.engines.pop(REPLICA_BIND)
+    counts['primary'] = 0
+    run_workload(client, args.reads)
+    baseline = counts['primary']
+    with app.app_context():
+        db.engines[REPLICA_BIND] = replica_engine
+
+    reduction = 100 * (1 - routed['primary'] / baseline) if baseline else 0
+    print(f"Primary statements for the same workload without a replica: {baseline} "
+          f"({reduction:.0f}% reduction with the replica)")
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    print('OK' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# shared_state.py
+# Key/value state shared by every worker process and node in a stateless
+# deployment. Backed by any SQLAlchemy URL: PostgreSQL in production, or a
+# local SQLite file as a stand-in for testing several workers on one machine.
+# Also holds both login rate limiters: the in-process SlidingWindowLimiter and
+# SharedWindowLimiter, which counts in the shared store.
+import json
+import threading
+from collections import OrderedDict, deque
+from time import monotonic, time
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, case, create_engine, delete, select
+
+metadata = MetaData()
+
+shared_state = Table(
+    'shared_state', metadata,
+    Column('key', String(200), primary_key=True),
+    Column('value', Text),
+    Column('counter', Integer, default=0),
+    Column('expires_at', Float),  # unix time, NULL = never
+)
+
+
+class SharedStore:
+    def __init__(self, url):
+        if url.startswith('postgres://'):
+            url = url.replace('postgres://', 'postgresql://', 1)
+        options = {'pool_pre_ping': True}
+        if url.startswith('sqlite'):
+            options['connect_args'] = {'timeout': 30}
+        self.engine = create_engine(url, **options)
+        if self.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif self.engine.dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise ValueError(f"Unsupported shared state backend: {self.engine.dialect.name}")
+        self._insert = insert
+        metadata.create_all(self.engine)
+
+    @staticmethod
+    def _expiry(ttl):
+        return time() + ttl if ttl else None
+
+    @staticmethod
+    def _live(now):
+        return (shared_state.c.expires_at.is_(None)) | (shared_state.c.expires_at > now)
+
+    def get(self, key, default=None):
+        with self.engine.connect() as conn:
+            value = conn.execute(
+                select(shared_state.c.value).where(shared_state.c.key == key, self._live(time()))
+            ).scalar()
+        return json.loads(value) if value is not None else default
+
+    def set(self, key, value, ttl=None):
+        row = {'key': key, 'value': json.dumps(value), 'counter': 0, 'expires_at': self._expiry(ttl)}
+        stmt = self._insert(shared_state).values(row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['key'],
+            set_={'value': stmt.excluded.value, 'expires_at': stmt.excluded.expires_at}
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it is absent or expired; returns True if this call stored it."""
+        now = time()
+        row = {'key': key, 'value': json.dumps(value), 'counter': 0, 'expires_at': self._expiry(ttl)}
+        stmt = self._insert(shared_state).values(row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['key'],
+            set_={'value': stmt.excluded.value, 'expires_at': stmt.excluded.expires_at},
+            where=~self._live(now)
+        )
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).rowcount == 1
+
+    def get_or_add(self, key, value, ttl=None):
+        self.add(key, value, ttl)
+        return self.get(key)
+
+    def incr(self, key, ttl=None):
+        """Atomically increment a counter (restarting it once expired) and return the new value."""
+        now = time()
+        expired = ~self._live(now)
+        stmt = self._insert(shared_state).values(key=key, counter=1, expires_at=self._expiry(ttl))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['key'],
+            set_={
+                'counter': case((expired, 1), else_=shared_state.c.counter + 1),
+                'expires_at': case((expired, stmt.excluded.expires_at), else_=shared_state.c.expires_at),
+            }
+        ).returning(shared_state.c.counter)
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).scalar()
+
+    def counter(self, key):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(shared_state.c.counter).where(shared_state.c.key == key, self._live(time()))
+            ).scalar() or 0
+
+    def delete(self, *keys):
+        with self.engine.begin() as conn:
+            conn.execute(delete(shared_state).where(shared_state.c.key.in_(keys)))
+
+    def delete_prefix(self, prefix):
+        with self.engine.begin() as conn:
+            conn.execute(delete(shared_state).where(shared_state.c.key.startswith(prefix, autoescape=True)))
+
+    def purge(self):
+        """Remove expired keys; returns the number of rows deleted."""
+        with self.engine.begin() as conn:
+            return conn.execute(delete(shared_state).where(shared_state.c.expires_at <= time())).rowcount
+
+
+class SharedWindowLimiter:
+    """Login limiter with the same interface as SlidingWindowLimiter, counted in a SharedStore.
+
+    Uses two fixed buckets per key and weights the previous one by how much of
+    it still overlaps the sliding window.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def hit(self, key, limit, window):
+        now = time()
+        bucket = int(now // window)
+        previous = self.store.counter(f"rl:{key}:{bucket - 1}")
+        overlap = 1 - (now % window) / window
+        # Rejected attempts aren't counted, matching SlidingWindowLimiter
+        if previous * overlap + self.store.counter(f"rl:{key}:{bucket}") >= limit:
+            return False
+        current = self.store.incr(f"rl:{key}:{bucket}", ttl=2 * window)
+        return previous * overlap + current <= limit
+
+    def reset(self, key):
+        self.store.delete_prefix(f"rl:{key}:")
+
+
+class SlidingWindowLimiter:
+    """In-process sliding-window limiter for the login path (one instance per worker)."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        # Keys in least-recently-hit order, so eviction always starts at the front
+        self._attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        """Record an attempt for key; return False if it exceeds limit within window seconds."""
+        now = monotonic()
+        cutoff = now - window
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                attempts = self._attempts[key] = deque()
+            else:
+                self._attempts.move_to_end(key)
+            # Bounded eviction: drop at most two of the oldest keys per call, first any
+            # that have aged out of the window, then the oldest if we're over max_keys
+            for _ in range(2):
+                oldest_key, oldest = next(iter(self._attempts.items()))
+                if oldest_key == key:
+                    break
+                stale = not oldest or oldest[-1] <= cutoff
+                if not stale and len(self._attempts) <= self.max_keys:
+                    break
+                self._attempts.popitem(last=False)
+            while attempts and attempts[0] <= cutoff:
+                attempts.popleft()
+            if len(attempts) >= limit:
+                return False
+            attempts.append(now)
+            return True
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)